@@ -0,0 +1,151 @@
+"""Headless benchmark of the dashboard at several data sizes.
+
+Times each stage of a rerun in-process (data load, index build, filter,
+map build, rollup/groupby, figure builds, chart JSON serialization), then
+the whole script through Streamlit's ``AppTest``, cold and warm. Results
+are emitted as JSON records so runs can be diffed to catch regressions.
+
+    python benchmarks/bench_dashboard.py --rows 10000 100000 1000000 --output results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import charts  # noqa: E402
+import marine_data  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def timed(fn, repeat):
+    """Best-of-``repeat`` wall time and the last return value"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_stages(rows, options, repeat):
+    """Per-stage timings, mirroring what one dashboard rerun does"""
+    records = []
+
+    def record(stage, seconds, **extra):
+        records.append({"rows": rows, "stage": stage, "seconds": seconds, **extra})
+
+    seconds, df = timed(lambda: synthetic.generate_occurrences(rows, **options), 1)
+    record("load", seconds, frame_bytes=int(df.memory_usage(deep=True).sum()))
+    seconds, index = timed(lambda: marine_data.OccurrenceIndex(df), 1)
+    record("index_build", seconds)
+    seconds, cube = timed(lambda: marine_data.build_rollup(index.df), 1)
+    record("rollup_build", seconds, cube_rows=len(cube))
+
+    meta = index.metadata()
+    start = meta["min_date"] + (meta["max_date"] - meta["min_date"]) / 4
+    end = meta["max_date"] - (meta["max_date"] - meta["min_date"]) / 4
+    filters = (None, start, end)
+    seconds, filtered = timed(lambda: index.filter(*filters), repeat)
+    record("filter", seconds, rows_out=len(filtered))
+
+    seconds, (fig_map, _) = timed(
+        lambda: charts.build_map_figure(
+            filtered, "Auto", charts.DEFAULT_ZOOM, charts.RAW_THRESHOLD, charts.MAX_POINTS
+        ), repeat
+    )
+    record("map_build", seconds)
+    seconds, series = timed(lambda: marine_data.rollup_series(cube, *filters), repeat)
+    record("groupby", seconds, rows_out=len(series))
+    seconds, fig_time = timed(lambda: charts.build_time_figure(series, "Daily"), repeat)
+    record("time_build", seconds)
+    seconds, fig_corr = timed(lambda: charts.build_corr_figure(filtered), repeat)
+    record("corr_build", seconds)
+
+    for name, fig in (("map", fig_map), ("time", fig_time), ("corr", fig_corr)):
+        seconds, payload = timed(fig.to_json, repeat)
+        record(f"serialize_{name}", seconds, payload_bytes=len(payload))
+    return records
+
+
+def bench_app(rows, options, repeat):
+    """Whole-script timings through AppTest: cold first run, then warm reruns"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["MOCK_ROWS"] = str(rows)
+    for key in ("days", "n_species", "clusters"):
+        env = {"n_species": "MOCK_SPECIES"}.get(key, f"MOCK_{key.upper()}")
+        if options.get(key) is not None:
+            os.environ[env] = str(options[key])
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+    start = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    warm, _ = timed(at.run, repeat)
+    return [
+        {"rows": rows, "stage": "rerun_cold", "seconds": cold},
+        {"rows": rows, "stage": "rerun_warm", "seconds": warm},
+    ]
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--species", type=int, default=None)
+    parser.add_argument("--clusters", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-app", action="store_true", help="skip the AppTest whole-script runs")
+    parser.add_argument("--output", default="-", help="JSON output path, '-' for stdout")
+    args = parser.parse_args()
+
+    options = {"days": args.days, "n_species": args.species, "clusters": args.clusters}
+    results = []
+    for rows in args.rows:
+        records = bench_stages(rows, options, args.repeat)
+        if not args.no_app:
+            records += bench_app(rows, options, args.repeat)
+        for r in records:
+            print(f"{r['rows']:>12,} {r['stage']:<16} {1000 * r['seconds']:>10.2f} ms", file=sys.stderr)
+        results += records
+
+    report = {"meta": run_metadata(), "options": options, "results": results}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
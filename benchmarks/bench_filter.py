@@ -0,0 +1,59 @@
+"""Time the sidebar filter: ``df.copy()`` + boolean masks vs ``OccurrenceIndex``.
+
+Frames come from ``synthetic.generate_occurrences``, the generator behind
+``load_mock_data``.
+
+    python benchmarks/bench_filter.py --rows 1000000 10000000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import marine_data  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def mask_filter(df, species, start, end):
+    """The filter block the dashboard used before the sorted index"""
+    filtered_df = df.copy()
+    if species is not None:
+        filtered_df = filtered_df[filtered_df["species"] == species]
+    return filtered_df[
+        (filtered_df["collection_date"] >= pd.to_datetime(start)) &
+        (filtered_df["collection_date"] <= pd.to_datetime(end))
+    ]
+
+
+def best_ms(fn, repeat):
+    return 1000 * min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--days", type=int, default=1000, help="date span of the synthetic data")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    start = pd.Timestamp("2022-06-01")
+    end = pd.Timestamp("2023-06-01")
+    cases = [("one species", synthetic.MOCK_SPECIES[1]), ("all species", None)]
+
+    print(f"{'rows':>12} {'filter':<12} {'masks (ms)':>11} {'index (ms)':>11} {'speedup':>8} {'matched':>11}")
+    for rows in args.rows:
+        df = synthetic.generate_occurrences(rows, days=args.days)
+        index = marine_data.OccurrenceIndex(df)
+        for label, species in cases:
+            expected = mask_filter(df, species, start, end)
+            assert len(index.filter(species, start, end)) == len(expected)
+            old = best_ms(lambda: mask_filter(df, species, start, end), args.repeat)
+            new = best_ms(lambda: index.filter(species, start, end), args.repeat)
+            print(f"{rows:>12,} {label:<12} {old:>11.2f} {new:>11.3f} {old / new:>7.0f}x {len(expected):>11,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Compare the single-shot ``read_sql`` loader with the chunked streaming loader.
+
+"first render" is the time until a map figure is built and serialized:
+the dashboard's provisional map from the first chunk when streaming, the
+real map after the whole load otherwise. "total" ends once the final map
+is built and serialized. Each loader runs in a fresh process so peak RSS
+is not polluted by the other.
+Point ``DATABASE_URL`` at a Postgres with a ``species_occurrence`` table to
+benchmark the real thing; otherwise a throwaway SQLite file is generated.
+
+    python benchmarks/bench_loader.py --rows 2000000 --chunksize 50000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import sqlalchemy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import charts  # noqa: E402
+import marine_data  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def build_sqlite(path, rows):
+    """Write ``rows`` synthetic occurrences into a SQLite file"""
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+    for chunk in synthetic.iter_occurrences(rows, chunksize=500_000, days=1000):
+        chunk.to_sql("species_occurrence", engine, if_exists="append", index=False)
+    return f"sqlite:///{path}"
+
+
+def peak_rss_mb():
+    # VmHWM is per address space; ru_maxrss survives exec and would report
+    # the parent's peak from building the SQLite fixture.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def render_map(df, mode="Auto", max_points=charts.MAX_POINTS):
+    """Build and serialize a map figure, as the dashboard does before anything shows"""
+    fig, _ = charts.build_map_figure(df, mode, charts.DEFAULT_ZOOM, charts.RAW_THRESHOLD, max_points)
+    return fig.to_json()
+
+
+def run_single_shot(url, chunksize, queue):
+    engine = sqlalchemy.create_engine(url)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    df = marine_data.downcast(pd.read_sql(marine_data.OCCURRENCE_QUERY, engine))
+    render_map(df)
+    elapsed = time.perf_counter() - start
+    # Nothing can render until the whole frame exists.
+    queue.put(("single-shot", len(df), elapsed, elapsed, peak_rss_mb() - baseline,
+               df.memory_usage(deep=True).sum() / 2**20))
+
+
+def run_streaming(url, chunksize, queue):
+    engine = sqlalchemy.create_engine(url)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    first = []
+
+    def on_chunk(chunk, rows):
+        if not first:
+            render_map(chunk, "Raw points", charts.PREVIEW_POINTS)
+            first.append(time.perf_counter() - start)
+
+    df = marine_data.read_occurrences(engine, chunksize=chunksize, on_chunk=on_chunk)
+    render_map(df)
+    elapsed = time.perf_counter() - start
+    queue.put(("streaming", len(df), first[0] if first else elapsed, elapsed,
+               peak_rss_mb() - baseline, df.memory_usage(deep=True).sum() / 2**20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows to generate for SQLite")
+    parser.add_argument("--chunksize", type=int, default=marine_data.DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = os.environ.get("DATABASE_URL") or build_sqlite(os.path.join(tmp, "bench.db"), args.rows)
+        ctx = mp.get_context("spawn")
+        print(f"{'loader':<12} {'rows':>10} {'first render (s)':>16} {'total (s)':>10} {'peak RSS Δ (MB)':>16} {'frame (MB)':>11}")
+        for target in (run_single_shot, run_streaming):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=target, args=(url, args.chunksize, queue))
+            proc.start()
+            name, rows, first, total, rss, frame = queue.get()
+            proc.join()
+            print(f"{name:<12} {rows:>10,} {first:>16.2f} {total:>10.2f} {rss:>16.1f} {frame:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
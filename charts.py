@@ -0,0 +1,121 @@
+"""Plotly figure builders for the dashboard panels.
+
+Kept out of ``app.py`` so benchmarks build exactly the figures the
+dashboard shows.
+"""
+import plotly.express as px
+
+import spatial
+
+MAP_MODES = ["Auto", "Heatmap", "Hexbin", "Raw points"]
+
+# Map defaults, overridable in app.py through the [map] settings. Raw markers
+# are only sent below RAW_THRESHOLD rows, and no mode sends more than the
+# payload of MAX_POINTS markers. PREVIEW_POINTS caps the provisional map.
+RAW_THRESHOLD = 20_000
+MAX_POINTS = 50_000
+PREVIEW_POINTS = 5_000
+DEFAULT_ZOOM = 6
+
+# Figure JSON per record relative to one raw marker (measured: ~56 bytes
+# per marker, ~65 per heatmap cell, ~255 per hexagon with its polygon).
+RECORD_COST = {"Raw points": 1.0, "Heatmap": 1.2, "Hexbin": 4.5}
+
+
+def build_map_figure(filtered_df, map_mode, map_zoom, raw_threshold, max_points):
+    """Occurrence map for the chosen mode; returns ``(fig, note)``
+
+    Every mode is held to the payload of ``max_points`` raw markers: binned
+    modes coarsen their cells until they fit. Above ``raw_threshold`` rows
+    "Auto" bins server-side, using hexagons at the zoom's cell size if they
+    send less than the decimated points would and a heatmap otherwise.
+    ``note`` is a caption to show under the map, or None.
+    """
+    cell_deg = spatial.cell_size_for_zoom(map_zoom)
+    budget = max_points
+    cells = None
+    if map_mode == "Auto":
+        budget = min(len(filtered_df), max_points)
+        if len(filtered_df) <= raw_threshold:
+            map_mode = "Raw points"
+        else:
+            cells = spatial.hex_bin(filtered_df, cell_deg)
+            map_mode = "Hexbin" if len(cells) * RECORD_COST["Hexbin"] <= budget else "Heatmap"
+            if map_mode != "Hexbin":
+                cells = None
+    center = None if filtered_df.empty else {
+        "lat": float(filtered_df["latitude"].mean()),
+        "lon": float(filtered_df["longitude"].mean()),
+    }
+    note = None
+
+    if map_mode in ("Heatmap", "Hexbin") and cells is None:
+        binner = spatial.grid_bin if map_mode == "Heatmap" else spatial.hex_bin
+        max_cells = budget / RECORD_COST[map_mode]
+        cells, binned_deg = spatial.bin_capped(binner, filtered_df, cell_deg, max_cells)
+        if binned_deg > cell_deg:
+            note = f"Cells enlarged to {binned_deg:.3g}° to keep the map under {int(max_cells):,} cells"
+            cell_deg = binned_deg
+
+    if map_mode == "Heatmap":
+        fig_map = px.density_mapbox(
+            cells,
+            lat="latitude",
+            lon="longitude",
+            z="abundance",
+            radius=max(2, round(cell_deg * spatial.pixels_per_degree(map_zoom))),
+            hover_data={"count": True, "temperature": ":.1f"},
+            center=center,
+            zoom=map_zoom,
+            height=500
+        )
+    elif map_mode == "Hexbin":
+        fig_map = px.choropleth_mapbox(
+            cells,
+            geojson=spatial.hexagon_geojson(cells, cell_deg),
+            locations="cell",
+            color="count",
+            hover_data={"cell": False, "abundance": True, "temperature": ":.1f"},
+            opacity=0.6,
+            center=center,
+            zoom=map_zoom,
+            height=500
+        )
+    else:
+        points = spatial.decimate(filtered_df, max_points)
+        if len(points) < len(filtered_df):
+            note = f"Showing a sample of {len(points):,} of {len(filtered_df):,} points"
+        fig_map = px.scatter_mapbox(
+            points,
+            lat="latitude",
+            lon="longitude",
+            color="species",
+            size="abundance",
+            hover_name="species",
+            hover_data={"temperature": True},
+            zoom=map_zoom,
+            height=500
+        )
+    fig_map.update_layout(mapbox_style="open-street-map")
+    return fig_map, note
+
+
+def build_time_figure(series, resolution):
+    """Mean abundance line chart from ``marine_data.rollup_series`` output"""
+    return px.line(
+        series,
+        x="collection_date",
+        y="abundance",
+        title=f"Mean Abundance Over Time ({resolution.lower()})"
+    )
+
+
+def build_corr_figure(filtered_df):
+    """Abundance vs temperature scatter, coloured by species"""
+    return px.scatter(
+        filtered_df,
+        x="temperature",
+        y="abundance",
+        color="species",
+        title="Abundance vs Temperature"
+    )
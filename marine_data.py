@@ -0,0 +1,624 @@
+"""Data access helpers for the Marine Data Explorer.
+
+Kept free of Streamlit UI calls so the same code can be driven from the
+dashboard, from benchmarks and from ad-hoc scripts.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from pandas.api.types import union_categoricals
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# SCHEMA
+# -----------------------------
+COLUMNS = ["species", "latitude", "longitude", "collection_date", "abundance", "temperature"]
+
+# Compact in-memory dtypes: ~3x smaller than the pandas defaults.
+DTYPES = {
+    "latitude": "float32",
+    "longitude": "float32",
+    "abundance": "int32",
+    "temperature": "float32",
+}
+
+DEFAULT_CHUNKSIZE = 50_000
+
+OCCURRENCE_QUERY = """
+    SELECT species, latitude, longitude, collection_date, abundance, temperature
+    FROM species_occurrence
+"""
+
+# Sidebar options come from these instead of the loaded frame. Both are
+# answered from an index on (species, collection_date):
+#   CREATE INDEX ON species_occurrence (species, collection_date);
+SPECIES_QUERY = "SELECT DISTINCT species FROM species_occurrence ORDER BY species"
+DATE_BOUNDS_QUERY = "SELECT MIN(collection_date), MAX(collection_date) FROM species_occurrence"
+
+
+# -----------------------------
+# FILTERS
+# -----------------------------
+def build_occurrence_query(species=None, start=None, end=None, since=None):
+    """Return ``(sql, params)`` for the occurrence query with filters pushed down
+
+    Only the active predicates are emitted, and all values are bound
+    parameters, so Postgres can plan an index range scan on
+    ``(species, collection_date)``. ``end`` is inclusive of the whole day;
+    ``since`` is the inclusive watermark day for incremental refreshes.
+    """
+    clauses = []
+    params = {}
+    if species is not None:
+        clauses.append("species = :species")
+        params["species"] = species
+    if start is not None:
+        clauses.append("collection_date >= :start")
+        params["start"] = pd.Timestamp(start).to_pydatetime()
+    if end is not None:
+        clauses.append("collection_date < :end")
+        params["end"] = (pd.Timestamp(end) + pd.Timedelta(days=1)).to_pydatetime()
+    if since is not None:
+        clauses.append("collection_date >= :since")
+        params["since"] = pd.Timestamp(since).to_pydatetime()
+    sql = OCCURRENCE_QUERY
+    if clauses:
+        sql += "    WHERE " + " AND ".join(clauses) + "\n"
+    return sql, params
+
+
+def bind_query(sql):
+    """``sqlalchemy.text`` with the date bounds typed, so the driver formats
+    them the way the column is stored rather than as plain strings"""
+    dates = [name for name in ("start", "end", "since") if f":{name}" in sql]
+    return sqlalchemy.text(sql).bindparams(
+        *[sqlalchemy.bindparam(name, type_=sqlalchemy.DateTime) for name in dates]
+    )
+
+
+def fetch_metadata(engine):
+    """Return the species list and date bounds without loading any rows"""
+    with engine.connect() as conn:
+        species = [row[0] for row in conn.execute(sqlalchemy.text(SPECIES_QUERY))]
+        min_date, max_date = conn.execute(sqlalchemy.text(DATE_BOUNDS_QUERY)).one()
+    return {
+        "species": species,
+        "min_date": pd.Timestamp(min_date),
+        "max_date": pd.Timestamp(max_date),
+    }
+
+
+# -----------------------------
+# IN-MEMORY INDEX
+# -----------------------------
+class OccurrenceIndex:
+    """A frame sorted by ``(species, collection_date)`` for slice-based filtering
+
+    Each species occupies one contiguous block and dates are sorted within it,
+    so a species + date filter is two ``searchsorted`` calls and an ``iloc``
+    slice: no boolean masks and no copy of the full frame. Slices share memory
+    with the index and must be treated as read-only.
+    """
+
+    def __init__(self, df, presorted=False):
+        if not isinstance(df["species"].dtype, pd.CategoricalDtype):
+            df = df.assign(species=df["species"].astype("category"))
+        if presorted:
+            self.df = df
+        else:
+            self.df = df.sort_values(["species", "collection_date"], kind="stable", ignore_index=True)
+        self.dates = self.df["collection_date"].to_numpy()
+        # Sorted category codes -> per-species [start, stop) row offsets
+        species = self.df["species"].cat
+        bounds = np.searchsorted(species.codes.to_numpy(), np.arange(len(species.categories) + 1))
+        self.offsets = {
+            str(name): (int(bounds[i]), int(bounds[i + 1]))
+            for i, name in enumerate(species.categories) if bounds[i] < bounds[i + 1]
+        }
+
+    def metadata(self):
+        """Same shape as ``fetch_metadata``, answered from the index alone"""
+        firsts = [self.dates[a] for a, b in self.offsets.values()]
+        lasts = [self.dates[b - 1] for a, b in self.offsets.values()]
+        return {
+            "species": sorted(self.offsets),
+            "min_date": pd.Timestamp(min(firsts)) if firsts else pd.NaT,
+            "max_date": pd.Timestamp(max(lasts)) if lasts else pd.NaT,
+        }
+
+    def _date_span(self, lo, hi, start, end):
+        dates = self.dates[lo:hi]
+        if start is not None:
+            lo_off = np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), side="left")
+        else:
+            lo_off = 0
+        if end is not None:
+            end = (pd.Timestamp(end) + pd.Timedelta(days=1)).to_datetime64()
+            hi_off = np.searchsorted(dates, end, side="left")
+        else:
+            hi_off = len(dates)
+        return lo + int(lo_off), lo + int(hi_off)
+
+    def replace_since(self, delta, since):
+        """A new index with every row dated on or after ``since`` swapped for ``delta``
+
+        Delta rows all belong at the end of their species' block, so each
+        block is cut at ``since`` and the sorted delta for that species is
+        spliced in behind it. The frame is copied once; nothing is re-sorted
+        but the delta.
+        """
+        if not isinstance(delta["species"].dtype, pd.CategoricalDtype):
+            delta = delta.assign(species=delta["species"].astype("category"))
+        delta = delta.sort_values(["species", "collection_date"], kind="stable", ignore_index=True)
+        codes = delta["species"].cat.codes.to_numpy()
+        names = delta["species"].cat.categories
+        bounds = np.searchsorted(codes, np.arange(len(names) + 1))
+        new_rows = {
+            str(name): delta.iloc[bounds[i]:bounds[i + 1]]
+            for i, name in enumerate(names) if bounds[i] < bounds[i + 1]
+        }
+        # Blocks follow category order. The empty leading piece makes
+        # concat_chunks list the existing categories first, then species
+        # seen only in the delta, matching the order pieces are added in.
+        pieces = [self.df.iloc[:0]]
+        for name in self.df["species"].cat.categories:
+            lo, hi = self.offsets.get(str(name), (0, 0))
+            cut, _ = self._date_span(lo, hi, since, None)
+            if lo < cut:
+                pieces.append(self.df.iloc[lo:cut])
+            if str(name) in new_rows:
+                pieces.append(new_rows.pop(str(name)))
+        pieces += new_rows.values()
+        return OccurrenceIndex(concat_chunks(pieces), presorted=True)
+
+    def filter(self, species=None, start=None, end=None):
+        """Rows matching the same filters as ``build_occurrence_query``"""
+        if species is not None:
+            lo, hi = self.offsets.get(species, (0, 0))
+            a, b = self._date_span(lo, hi, start, end)
+            return self.df.iloc[a:b]
+        spans = [self._date_span(lo, hi, start, end) for lo, hi in self.offsets.values()]
+        if all(span == bounds for span, bounds in zip(spans, self.offsets.values())):
+            return self.df
+        # One block per species: gather just the matching rows.
+        rows = np.concatenate([np.arange(a, b) for a, b in spans]) if spans else np.arange(0)
+        return self.df.take(rows)
+
+
+# -----------------------------
+# ROLLUP CUBE
+# -----------------------------
+# Abundance sum and row count per (species, day). Means for any species/date
+# filter and any coarser resolution are derived from these two additive
+# measures, so the time-series chart never touches the raw rows. To serve it
+# from Postgres, create the view below and set database.rollup_view:
+#   CREATE MATERIALIZED VIEW species_daily_rollup AS
+#   SELECT species, DATE(collection_date) AS collection_date,
+#          SUM(abundance) AS abundance_sum, COUNT(*) AS count
+#   FROM species_occurrence GROUP BY species, DATE(collection_date);
+ROLLUP_QUERY = """
+    SELECT species, DATE(collection_date) AS collection_date,
+           SUM(abundance) AS abundance_sum, COUNT(*) AS count
+    FROM species_occurrence{where}
+    GROUP BY species, DATE(collection_date)
+"""
+
+RESAMPLE_FREQS = {"Daily": "D", "Weekly": "W", "Monthly": "MS"}
+
+
+def build_rollup(df):
+    """Reduce occurrences to the per-(species, day) rollup cube"""
+    cube = (
+        df.groupby(["species", df["collection_date"].dt.floor("D")], observed=True)["abundance"]
+        .agg(abundance_sum="sum", count="size")
+        .reset_index()
+    )
+    cube["abundance_sum"] = cube["abundance_sum"].astype("int64")
+    return cube
+
+
+def fetch_rollup(engine, view=None, since=None):
+    """Read the rollup cube from Postgres, from day ``since`` onwards
+
+    Without a view the aggregate runs server-side. A materialized view is
+    refreshed by Postgres itself, so it is always read in full and ``since``
+    is ignored.
+    """
+    if view is not None:
+        query = f"SELECT species, collection_date, abundance_sum, count FROM {view}"
+        params = None
+    elif since is not None:
+        query = ROLLUP_QUERY.format(where="\n    WHERE collection_date >= :since")
+        params = {"since": pd.Timestamp(since).to_pydatetime()}
+    else:
+        query = ROLLUP_QUERY.format(where="")
+        params = None
+    with engine.connect() as conn:
+        cube = pd.read_sql(bind_query(query), conn, params=params, parse_dates=["collection_date"])
+    cube["species"] = cube["species"].astype("category")
+    return cube.astype({"abundance_sum": "int64", "count": "int64"})
+
+
+def replace_rollup_days(cube, delta, since):
+    """Swap every day from ``since`` onwards for the freshly aggregated ``delta``"""
+    combined = pd.concat(
+        [cube[(cube["collection_date"] < pd.Timestamp(since)).to_numpy()], delta], ignore_index=True
+    )
+    combined["species"] = combined["species"].astype(str).astype("category")
+    return combined
+
+
+def rollup_series(cube, species=None, start=None, end=None, freq="D"):
+    """Mean abundance per period for the given filters, derived from the cube"""
+    mask = np.ones(len(cube), dtype=bool)
+    if species is not None:
+        mask &= (cube["species"] == species).to_numpy()
+    if start is not None:
+        mask &= (cube["collection_date"] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (cube["collection_date"] <= pd.Timestamp(end)).to_numpy()
+    totals = (
+        cube.loc[mask, ["collection_date", "abundance_sum", "count"]]
+        .set_index("collection_date")
+        .resample(freq)
+        .sum()
+    )
+    totals = totals[totals["count"] > 0]
+    return pd.DataFrame({
+        "collection_date": totals.index,
+        "abundance": (totals["abundance_sum"] / totals["count"]).to_numpy(),
+    })
+
+
+# -----------------------------
+# INCREMENTAL REFRESH
+# -----------------------------
+def watermark_day(dates, default=None):
+    """Start of the latest day in ``dates``: the next refresh re-reads from here"""
+    if len(dates) == 0:
+        return default
+    return pd.Timestamp(dates.max()).floor("D")
+
+
+class IncrementalStore:
+    """Loaded data plus a watermark day, kept current on an interval
+
+    ``load(since, on_chunk)`` returns ``(data, watermark)``: everything when
+    ``since`` is None, otherwise every row dated on or after day ``since``.
+    ``merge(data, delta, since)`` drops what ``data`` held from ``since``
+    onwards and puts ``delta`` in its place. Re-reading the whole watermark
+    day means rows that land later on that same day are still picked up,
+    which matters because ``collection_date`` is usually day-granular.
+    ``seed()``, if given, returns a local ``(data, watermark)`` (or None) to
+    start from instead, so the first load only fetches from that watermark.
+
+    One store is meant to be shared by every session, so a refresh runs in at
+    most one thread while the others keep serving the current data. If the
+    first load fails, ``get`` re-raises that error without retrying until
+    ``interval`` has passed, so callers can fall back quickly. Rows inserted
+    with a date before the watermark day (late back-dated entries) are only
+    picked up by a full reload (clearing the cache).
+    """
+
+    def __init__(self, load, merge, interval, seed=None):
+        self._load = load
+        self._merge = merge
+        self._seed = seed
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.data = None
+        self.watermark = None
+        self.refreshed_at = None
+        self.rows_fetched = 0
+        self.error = None
+        self.failed_at = None
+
+    def get(self, on_chunk=None):
+        if self.data is None:
+            with self._lock:
+                if self.data is None:
+                    if self.failed_at is not None and time.monotonic() - self.failed_at < self.interval:
+                        raise self.error
+                    if self._seed_from_local():
+                        return self.data
+                    try:
+                        self.data, self.watermark = self._load(None, on_chunk)
+                    except Exception as e:
+                        self.error = e
+                        self.failed_at = time.monotonic()
+                        raise
+                    self.error = None
+                    self.failed_at = None
+                    self.refreshed_at = time.monotonic()
+            return self.data
+        if time.monotonic() - self.refreshed_at >= self.interval and self._lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._lock.release()
+        return self.data
+
+    def _seed_from_local(self):
+        """Start from ``seed()`` and fetch only what is newer; False if there is no seed"""
+        try:
+            seeded = self._seed() if self._seed is not None else None
+        except Exception:
+            logger.warning("Could not seed from local data; loading in full", exc_info=True)
+            seeded = None
+        if seeded is None:
+            return False
+        self.data, self.watermark = seeded
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """Re-read from the watermark day and merge; keep stale data on failure"""
+        since = self.watermark
+        try:
+            delta, watermark = self._load(since, None)
+        except Exception:
+            logger.warning("Incremental refresh failed; serving cached data", exc_info=True)
+        else:
+            if since is None:
+                self.data = delta
+            else:
+                self.data = self._merge(self.data, delta, since)
+            self.rows_fetched += len(delta)
+            self.watermark = watermark
+        finally:
+            self.refreshed_at = time.monotonic()
+
+
+def replace_rows_since(index, delta, since):
+    """Swap every row dated on or after ``since`` for ``delta``"""
+    return index.replace_since(delta, since)
+
+
+def occurrence_store(engine, species=None, interval=300, chunksize=DEFAULT_CHUNKSIZE, seed=None):
+    """An ``IncrementalStore`` over an ``OccurrenceIndex`` of one species (or all)
+
+    Date ranges are not pushed down: they change with the date picker and
+    with the latest survey date, so the store keeps every date and callers
+    slice it with ``OccurrenceIndex.filter``. ``seed(species)`` may return
+    local ``(rows, watermark)``, e.g. ``snapshot.read_seed``, to start from.
+    """
+
+    def load(since, on_chunk):
+        query, params = build_occurrence_query(species, since=since)
+        df = read_occurrences(engine, query, params, chunksize=chunksize, on_chunk=on_chunk)
+        data = df if since is not None else OccurrenceIndex(df)
+        return data, watermark_day(df["collection_date"], since)
+
+    def seed_index():
+        seeded = seed(species)
+        if seeded is None:
+            return None
+        df, watermark = seeded
+        return OccurrenceIndex(df), watermark
+
+    return IncrementalStore(load, replace_rows_since, interval, seed_index if seed else None)
+
+
+class OccurrenceStores:
+    """Per-species occurrence stores that give way to one all-species store
+
+    ``make_store(species)`` builds a store, with ``species`` None for all of
+    them. Stores are keyed on species alone: date ranges are sliced in memory
+    with ``OccurrenceIndex.filter``, so moving the date picker, or the latest
+    survey date moving on, never reloads anything. Dates are no longer
+    pushed down to Postgres, so memory is what this trades for that:
+
+    - A species store holds every date of that species, so picking one
+      species never loads the whole table. Up to ``max_species`` of them are
+      kept, least recently used evicted first. Each holds its own rows and
+      issues its own refresh query.
+    - Choosing all species loads the whole table once. From then on every
+      species is served from that store (``filter`` slices it without
+      copying) and the species stores are dropped. No row is held twice and
+      one refresh query per interval covers everything.
+    """
+
+    def __init__(self, make_store, max_species=32):
+        self._make_store = make_store
+        self.max_species = max_species
+        self._lock = threading.Lock()
+        self._stores = {}
+
+    def get(self, species=None):
+        """The store to serve ``species`` from"""
+        with self._lock:
+            everything = self._stores.get(None)
+            if everything is not None and everything.data is not None:
+                if len(self._stores) > 1:
+                    self._stores = {None: everything}
+                return everything
+            store = self._stores.pop(species, None)
+            if store is None:
+                store = self._make_store(species)
+            self._stores[species] = store
+            cached = [key for key in self._stores if key is not None]
+            for key in cached[:max(0, len(cached) - self.max_species)]:
+                del self._stores[key]
+            return store
+
+
+def rollup_store(engine, view=None, interval=300):
+    """An ``IncrementalStore`` over the rollup cube"""
+
+    def load(since, on_chunk):
+        cube = fetch_rollup(engine, view, since)
+        return cube, watermark_day(cube["collection_date"], since)
+
+    # A materialized view is re-read in full, so its "delta" replaces the cube.
+    merge = replace_rollup_days if view is None else (lambda cube, delta, since: delta)
+    return IncrementalStore(load, merge, interval)
+
+
+# -----------------------------
+# CONNECTION POOL
+# -----------------------------
+class PoolStats:
+    """Thread-safe counters for connection checkouts and time spent waiting"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": 1000 * self.total_wait / attempts if attempts else 0.0,
+                "max_wait_ms": 1000 * self.max_wait,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return record
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def create_pooled_engine(url, pool_size=5, max_overflow=10, pool_timeout=30,
+                         pool_pre_ping=True, statement_timeout_ms=None):
+    """Create an engine with an instrumented connection pool
+
+    Meant to be built once per process and shared by every session.
+    """
+    connect_args = {}
+    if statement_timeout_ms and url.startswith("postgresql"):
+        connect_args["options"] = f"-c statement_timeout={int(statement_timeout_ms)}"
+    return sqlalchemy.create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+def pool_status(engine):
+    """Current pool occupancy plus cumulative checkout/wait statistics"""
+    pool = engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    status.update(pool.stats.snapshot())
+    return status
+
+
+# -----------------------------
+# DOWNCASTING
+# -----------------------------
+def downcast(df):
+    """Convert a frame to the compact dashboard dtypes (in place where possible)"""
+    df["species"] = df["species"].astype("category")
+    df["collection_date"] = pd.to_datetime(df["collection_date"])
+    return df.astype(DTYPES, copy=False)
+
+
+def _column(chunk, name):
+    return chunk[name].array if name == "species" else chunk[name].to_numpy()
+
+
+def _assemble(parts):
+    """Build a frame from per-column lists of chunk arrays
+
+    Each list is emptied as soon as its column is built, so the pieces are
+    freed one column at a time rather than after the whole frame exists.
+    """
+    columns = {}
+    for name in COLUMNS:
+        pieces = parts.pop(name)
+        columns[name] = union_categoricals(pieces) if name == "species" else np.concatenate(pieces)
+        pieces.clear()
+    return pd.DataFrame(columns, copy=False)
+
+
+def concat_chunks(chunks):
+    """Concatenate downcast chunks without losing the categorical species column"""
+    if not chunks:
+        return downcast(pd.DataFrame({c: pd.Series(dtype="object") for c in COLUMNS}))
+    return _assemble({name: [_column(c, name) for c in chunks] for name in COLUMNS})
+
+
+# -----------------------------
+# STREAMING LOADER
+# -----------------------------
+def iter_occurrence_chunks(engine, query=OCCURRENCE_QUERY, params=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield downcast chunks read through a server-side cursor
+
+    ``stream_results`` makes psycopg2 use a named cursor, so only one chunk
+    is held client-side at a time instead of the full result set.
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        for chunk in pd.read_sql(bind_query(query), conn, params=params, chunksize=chunksize):
+            yield downcast(chunk)
+
+
+def read_occurrences(engine, query=OCCURRENCE_QUERY, params=None,
+                     chunksize=DEFAULT_CHUNKSIZE, on_chunk=None):
+    """Stream a query into a single compact frame
+
+    ``on_chunk(chunk, rows_so_far)`` is called as each chunk lands so callers
+    can report progress or draw a preview before the full result set has
+    arrived. Only the column arrays of each chunk are kept, and they are
+    released column by column while the frame is assembled, so peak memory
+    is about the final frame plus its widest column rather than twice the
+    frame.
+    """
+    parts = {name: [] for name in COLUMNS}
+    rows = 0
+    for chunk in iter_occurrence_chunks(engine, query, params, chunksize):
+        rows += len(chunk)
+        if on_chunk is not None:
+            on_chunk(chunk, rows)
+        for name in COLUMNS:
+            parts[name].append(_column(chunk, name))
+        del chunk
+    if not rows:
+        return concat_chunks([])
+    return _assemble(parts)
@@ -0,0 +1,222 @@
+"""Lightweight per-rerun timing for the dashboard.
+
+A ``Recorder`` times named stages of one script run and notes rows, frame
+memory and figure payload size. Finished runs are folded into process-wide
+totals, which can be logged as JSON lines or scraped in Prometheus text
+format. When instrumentation is off the app uses ``NULL``, whose methods do
+nothing, so the hot path only pays for a no-op context manager per stage.
+"""
+import contextlib
+import functools
+import http.server
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+
+# Process-wide aggregates exported to monitoring
+_stage_totals = {}   # stage -> [count, seconds]
+_stage_last = {}     # stage -> last record
+_cache_counts = {}   # cache name -> {"hit": n, "miss": n}
+_reruns = [0, 0.0]   # count, seconds
+
+
+# -----------------------------
+# CACHE HIT / MISS
+# -----------------------------
+def cache_event(name, hit):
+    """Count a cache lookup, process-wide and on the current rerun's recorder"""
+    with _lock:
+        counts = _cache_counts.setdefault(name, {"hit": 0, "miss": 0})
+        counts["hit" if hit else "miss"] += 1
+    recorder = getattr(_local, "recorder", None)
+    if recorder is not None:
+        recorder.caches.append({"cache": name, "result": "hit" if hit else "miss"})
+
+
+def track_cache(name, cache):
+    """Wrap ``cache`` (e.g. ``st.cache_data``) so lookups count as hits or misses
+
+    The wrapped body only runs on a miss, so a flag set there tells the two
+    apart without any help from Streamlit.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def on_miss(*args, **kwargs):
+            _local.missed = True
+            return fn(*args, **kwargs)
+
+        cached = cache(on_miss)
+
+        @functools.wraps(fn)
+        def lookup(*args, **kwargs):
+            outer = getattr(_local, "missed", False)
+            _local.missed = False
+            try:
+                result = cached(*args, **kwargs)
+                cache_event(name, hit=not _local.missed)
+                return result
+            finally:
+                _local.missed = outer
+
+        lookup.clear = cached.clear
+        return lookup
+    return decorator
+
+
+# -----------------------------
+# RECORDERS
+# -----------------------------
+class Recorder:
+    """Stage timings and sizes for one script run"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+        self.caches = []
+        self.total = None
+        _local.recorder = self
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {"stage": name}
+        self.stages.append(record)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["seconds"] = time.perf_counter() - start
+
+    def annotate(self, rows=None, frame=None, figure=None):
+        """Attach sizes to the most recent stage"""
+        record = self.stages[-1]
+        if rows is not None:
+            record["rows"] = int(rows)
+        if frame is not None:
+            record["frame_bytes"] = int(frame.memory_usage(deep=True).sum())
+        if figure is not None:
+            record["payload_bytes"] = len(figure.to_json())
+
+    def finish(self, log=False):
+        """Close the run and fold it into the process-wide totals"""
+        self.total = time.perf_counter() - self.start
+        _local.recorder = None
+        with _lock:
+            _reruns[0] += 1
+            _reruns[1] += self.total
+            for record in self.stages:
+                totals = _stage_totals.setdefault(record["stage"], [0, 0.0])
+                totals[0] += 1
+                totals[1] += record["seconds"]
+                _stage_last[record["stage"]] = record
+        if log:
+            logger.info(json.dumps({
+                "event": "rerun",
+                "total_seconds": self.total,
+                "stages": self.stages,
+                "caches": self.caches,
+            }))
+
+
+class _NullRecorder:
+    """Stand-in used when instrumentation is off"""
+
+    stages = ()
+    caches = ()
+    total = None
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def annotate(self, rows=None, frame=None, figure=None):
+        pass
+
+    def finish(self, log=False):
+        pass
+
+
+NULL = _NullRecorder()
+
+
+def start(enabled):
+    """A fresh ``Recorder`` for this run, or ``NULL`` when instrumentation is off"""
+    if enabled:
+        return Recorder()
+    _local.recorder = None
+    return NULL
+
+
+# -----------------------------
+# EXPORT
+# -----------------------------
+def enable_logging():
+    """Emit one JSON line per finished rerun to stderr"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def prometheus_text():
+    """Process-wide totals in the Prometheus text exposition format"""
+    lines = [
+        "# HELP marine_rerun_seconds Wall time of instrumented dashboard reruns.",
+        "# TYPE marine_rerun_seconds summary",
+    ]
+    with _lock:
+        lines.append(f"marine_rerun_seconds_count {_reruns[0]}")
+        lines.append(f"marine_rerun_seconds_sum {_reruns[1]:.6f}")
+        lines += [
+            "# HELP marine_stage_seconds Wall time per dashboard stage.",
+            "# TYPE marine_stage_seconds summary",
+        ]
+        for stage, (count, seconds) in sorted(_stage_totals.items()):
+            lines.append(f'marine_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines.append(f'marine_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+        for metric, key, help_text in (
+            ("marine_stage_rows", "rows", "Rows produced by the stage on its last run."),
+            ("marine_stage_frame_bytes", "frame_bytes", "Frame memory after the stage on its last run."),
+            ("marine_stage_payload_bytes", "payload_bytes", "Figure JSON size from the stage on its last run."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for stage, record in sorted(_stage_last.items()):
+                if key in record:
+                    lines.append(f'{metric}{{stage="{stage}"}} {record[key]}')
+        lines += [
+            "# HELP marine_cache_lookups_total Cache lookups by result.",
+            "# TYPE marine_cache_lookups_total counter",
+        ]
+        for name, counts in sorted(_cache_counts.items()):
+            for result, count in counts.items():
+                lines.append(f'marine_cache_lookups_total{{cache="{name}",result="{result}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve ``prometheus_text`` on ``http://host:port/metrics`` from a daemon thread"""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="perf-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,343 @@
+"""Local Parquet snapshot of the occurrence data.
+
+The snapshot is a hive-partitioned dataset (``species=<name>/year=<yyyy>``)
+plus a small ``_snapshot.json`` marker. It lets the dashboard start without
+touching Postgres and keeps serving real data while the database is down.
+
+The marker lists every live file with its row count and size, so readers
+only open files that belong to a complete snapshot and nothing has to walk
+the tree. Rows from the watermark day onwards sit in "open" files that each
+refresh replaces, because that day can still receive rows. Earlier days are
+"sealed" and only ever appended to or compacted.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+import marine_data
+
+logger = logging.getLogger(__name__)
+
+MARKER = "_snapshot.json"
+
+# A partition with more sealed files than this is rewritten as a single file
+COMPACT_FILES = 32
+
+# Replaced files stay on disk this long, so readers that picked up the
+# previous marker can finish before the files they list disappear
+RETIRE_AFTER_S = 600
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("species", pa.string()), ("year", pa.int32())]), flavor="hive"
+)
+
+# Fixed so streamed chunks all match, whatever dtypes each chunk came back with
+SCHEMA = pa.schema([
+    ("species", pa.string()),
+    ("latitude", pa.float32()),
+    ("longitude", pa.float32()),
+    ("collection_date", pa.timestamp("ns")),
+    ("abundance", pa.int32()),
+    ("temperature", pa.float32()),
+    ("year", pa.int32()),
+])
+
+
+def _to_table(df):
+    df = df.assign(year=df["collection_date"].dt.year.astype("int32"))
+    df["species"] = df["species"].astype(str)
+    return pa.Table.from_pandas(df[SCHEMA.names], preserve_index=False).cast(SCHEMA)
+
+
+def _write_files(data, path, prefix):
+    """Write a table or batch reader into the partitions under ``path``
+
+    Returns ``{relative path: {"rows": n, "bytes": n}}`` for the new files.
+    """
+    files = {}
+
+    def visit(written):
+        files[os.path.relpath(written.path, path)] = {
+            "rows": written.metadata.num_rows, "bytes": written.size,
+        }
+
+    ds.write_dataset(
+        data, path, format="parquet", partitioning=PARTITIONING,
+        basename_template=f"{prefix}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore", file_visitor=visit,
+    )
+    return files
+
+
+def _read_marker(path):
+    try:
+        with open(os.path.join(path, MARKER)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Snapshots written before the file list existed are rebuilt from scratch
+    return marker if "files" in marker and "version" in marker else None
+
+
+def _write_marker(path, files, open_files=(), watermark=None, retired=(), version=None):
+    now = time.time()
+    marker = {
+        "written_at": now,
+        # Changes only when rows do, so readers can cache on it
+        "version": now if version is None else version,
+        "rows": sum(f["rows"] for f in files.values()),
+        "bytes": sum(f["bytes"] for f in files.values()),
+        "watermark": None if watermark is None else str(watermark),
+        "files": files,
+        "open": sorted(open_files),
+        "retired": list(retired),
+    }
+    tmp = os.path.join(path, MARKER + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(marker, f)
+    os.replace(tmp, os.path.join(path, MARKER))
+
+
+def _update_marker(path, marker, added, removed, open_files=None, watermark=None, rows_changed=True):
+    """Swap ``removed`` files for ``added`` ones in the marker
+
+    Removed files are deleted once they have been retired for
+    ``RETIRE_AFTER_S``, on a later update. The version is kept when the
+    rows are unchanged, e.g. after compaction.
+    """
+    now = time.time()
+    retired = []
+    for name, retired_at in marker["retired"]:
+        if now - retired_at < RETIRE_AFTER_S:
+            retired.append([name, retired_at])
+        else:
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+    retired += [[name, now] for name in removed]
+    removed_set = set(removed)
+    files = {name: f for name, f in marker["files"].items() if name not in removed_set}
+    files.update(added)
+    _write_marker(
+        path, files,
+        marker["open"] if open_files is None else open_files,
+        marker["watermark"] if watermark is None else watermark,
+        retired,
+        None if rows_changed else marker["version"],
+    )
+
+
+def write_snapshot(chunks, path, latest=None):
+    """Replace the snapshot at ``path``
+
+    ``chunks`` (frames) hold the sealed rows and are streamed through a
+    ``RecordBatchReader``, so only one is in memory at a time. ``latest``
+    holds the rows from the watermark day onwards, which go to open files.
+    Written to a sibling directory and swapped in, so readers never see a
+    half-written snapshot.
+    """
+    batches = (batch for chunk in chunks for batch in _to_table(chunk).to_batches())
+    tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp)
+    files = _write_files(pa.RecordBatchReader.from_batches(SCHEMA, batches), tmp, "part")
+    open_files = {}
+    watermark = None
+    if latest is not None and len(latest):
+        open_files = _write_files(_to_table(latest), tmp, "open")
+        watermark = marine_data.watermark_day(latest["collection_date"])
+    _write_marker(tmp, {**files, **open_files}, open_files, watermark)
+    old = f"{path}.old-{uuid.uuid4().hex[:8]}"
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _same_rows(a, b):
+    """Whether two frames hold the same rows, in any order"""
+    if len(a) != len(b):
+        return False
+
+    def normalized(df):
+        df = df.assign(
+            species=df["species"].astype(str),
+            collection_date=df["collection_date"].astype("datetime64[ns]"),
+        )
+        return df[marine_data.COLUMNS].sort_values(marine_data.COLUMNS, ignore_index=True)
+
+    return normalized(a).equals(normalized(b))
+
+
+def replace_latest(df, path):
+    """Replace the open files with ``df``, every row since the watermark day
+
+    Days before the latest one in ``df`` are sealed; the latest day becomes
+    the new watermark and stays open for the next refresh. When ``df`` holds
+    exactly the rows already in the open files, nothing is rewritten and the
+    version stays the same.
+    """
+    marker = _read_marker(path)
+    since = pd.Timestamp(marker["watermark"])
+    watermark = marine_data.watermark_day(df["collection_date"], since)
+    if watermark == since:
+        current = _read_files(path, {"files": dict.fromkeys(marker["open"])}, marine_data.COLUMNS, None)
+        if _same_rows(df, current):
+            if any(time.time() - retired_at >= RETIRE_AFTER_S for _, retired_at in marker["retired"]):
+                _update_marker(path, marker, {}, [], rows_changed=False)
+            return False
+    is_open = (df["collection_date"] >= watermark).to_numpy()
+    added = {}
+    if (~is_open).any():
+        added.update(_write_files(_to_table(df[~is_open]), path, "part"))
+    open_files = {}
+    if is_open.any():
+        open_files = _write_files(_to_table(df[is_open]), path, "open")
+    added.update(open_files)
+    _update_marker(path, marker, added, marker["open"], open_files=list(open_files), watermark=watermark)
+    return True
+
+
+def compact_snapshot(path, max_files=COMPACT_FILES):
+    """Rewrite every partition holding more than ``max_files`` sealed files as one file
+
+    Batches are streamed from the old files into the new one, so memory
+    stays bounded by the Parquet row group size rather than the partition.
+    """
+    marker = _read_marker(path)
+    partitions = {}
+    for name in marker["files"]:
+        if name not in marker["open"]:
+            partitions.setdefault(os.path.dirname(name), []).append(name)
+    added = {}
+    removed = []
+    for partition, names in partitions.items():
+        if len(names) <= max_files:
+            continue
+        dataset = ds.dataset([os.path.join(path, name) for name in names], format="parquet")
+        target = os.path.join(partition, f"part-{uuid.uuid4().hex[:8]}-0.parquet")
+        with pq.ParquetWriter(os.path.join(path, target), dataset.schema) as writer:
+            for batch in dataset.to_batches():
+                writer.write_batch(batch)
+        added[target] = {
+            "rows": sum(marker["files"][name]["rows"] for name in names),
+            "bytes": os.path.getsize(os.path.join(path, target)),
+        }
+        removed += names
+    if removed:
+        _update_marker(path, marker, added, removed, rows_changed=False)
+    return len(removed)
+
+
+def _read_files(path, marker, columns, species):
+    dataset = ds.dataset(
+        [os.path.join(path, name) for name in marker["files"]], schema=SCHEMA,
+        format="parquet", partitioning=PARTITIONING, partition_base_dir=path,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    # A species filter only opens that species' partitions
+    predicate = None if species is None else ds.field("species") == species
+    df = dataset.to_table(columns=list(columns), filter=predicate).to_pandas()
+    return marine_data.downcast(df)
+
+
+def read_snapshot(path, columns=marine_data.COLUMNS, species=None):
+    """Load the snapshot memory-mapped, reading only ``columns`` (and ``species``)"""
+    return _read_files(path, _read_marker(path), columns, species)
+
+
+def read_seed(path, species=None):
+    """``(rows, watermark day)`` to seed an ``IncrementalStore``, or None without a snapshot
+
+    Rows and watermark come from the same marker, so fetching everything
+    from the watermark day onwards brings the rows up to date.
+    """
+    marker = _read_marker(path)
+    if marker is None or marker["watermark"] is None:
+        return None
+    df = _read_files(path, marker, marine_data.COLUMNS, species)
+    return df, pd.Timestamp(marker["watermark"])
+
+
+def snapshot_info(path):
+    """Age, size and watermark of the snapshot, or None if there is none
+
+    Answered from the marker alone, so it is cheap enough to call on every rerun.
+    """
+    marker = _read_marker(path)
+    if marker is None:
+        return None
+    return {
+        "written_at": marker["written_at"],
+        "version": marker["version"],
+        "age_s": time.time() - marker["written_at"],
+        "rows": marker["rows"],
+        "bytes": marker["bytes"],
+        "files": len(marker["files"]),
+        "watermark": marker["watermark"],
+    }
+
+
+class SnapshotRefresher:
+    """Background thread that keeps the snapshot in step with Postgres
+
+    The first run streams the whole table to disk chunk by chunk. Later runs
+    re-read only the rows from the watermark day onwards, replace the open
+    files with them and compact partitions that have gathered too many small
+    files, so nothing is held in memory between runs.
+    """
+
+    def __init__(self, engine, path, interval=300):
+        self.engine = engine
+        self.path = path
+        self.interval = interval
+        self.last_error = None
+        self.last_run = None
+        self._thread = threading.Thread(target=self._loop, name="snapshot-refresh", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def run_once(self):
+        info = snapshot_info(self.path)
+        if info is None or info["watermark"] is None:
+            self.rebuild()
+            return
+        query, params = marine_data.build_occurrence_query(since=info["watermark"])
+        replace_latest(marine_data.read_occurrences(self.engine, query, params), self.path)
+        compact_snapshot(self.path)
+
+    def rebuild(self):
+        """Write a fresh snapshot: sealed days streamed, the latest day kept open"""
+        with self.engine.connect() as conn:
+            _, max_date = conn.execute(marine_data.bind_query(marine_data.DATE_BOUNDS_QUERY)).one()
+        if max_date is None:
+            write_snapshot([], self.path)
+            return
+        watermark = pd.Timestamp(max_date).floor("D")
+        query, params = marine_data.build_occurrence_query(since=watermark)
+        latest = marine_data.read_occurrences(self.engine, query, params)
+        query, params = marine_data.build_occurrence_query(end=watermark - pd.Timedelta(days=1))
+        write_snapshot(marine_data.iter_occurrence_chunks(self.engine, query, params), self.path, latest)
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                logger.warning("Snapshot refresh failed", exc_info=True)
+            self.last_run = time.time()
+            time.sleep(self.interval)
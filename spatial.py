@@ -0,0 +1,125 @@
+"""Server-side spatial aggregation for the occurrence map.
+
+Binning happens in NumPy so the browser receives one record per cell
+instead of one marker per occurrence. Cells are laid out in plain
+lon/lat degrees, which is close enough at the regional scales we map.
+"""
+import numpy as np
+import pandas as pd
+
+# Web-mercator tiles are 256 px wide; aim for a cell every 256 / 32 = 8 px.
+CELLS_PER_TILE = 32
+
+CELL_COLUMNS = ["cell", "latitude", "longitude", "count", "abundance", "temperature"]
+
+
+def cell_size_for_zoom(zoom, cells_per_tile=CELLS_PER_TILE):
+    """Cell width in degrees so cells stay a constant size on screen"""
+    return 360.0 / (2 ** zoom) / cells_per_tile
+
+
+def pixels_per_degree(zoom):
+    return 256 * 2 ** zoom / 360.0
+
+
+def _aggregate(df, keys, center_lat, center_lon):
+    """Reduce points to one row per unique key: count, summed abundance, mean temperature"""
+    if len(keys) == 0:
+        return pd.DataFrame({c: pd.Series(dtype="float64") for c in CELL_COLUMNS})
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    count = np.bincount(inverse)
+    abundance = np.bincount(inverse, weights=df["abundance"].to_numpy(dtype="float64"))
+    temperature = np.bincount(inverse, weights=df["temperature"].to_numpy(dtype="float64")) / count
+    return pd.DataFrame({
+        "cell": uniq.astype(str),
+        "latitude": center_lat[first],
+        "longitude": center_lon[first],
+        "count": count,
+        "abundance": abundance,
+        "temperature": temperature,
+    })
+
+
+def grid_bin(df, cell_deg):
+    """Aggregate points into a square lon/lat grid of ``cell_deg`` degrees"""
+    lat = df["latitude"].to_numpy(dtype="float64")
+    lon = df["longitude"].to_numpy(dtype="float64")
+    iy = np.floor((lat + 90) / cell_deg).astype(np.int64)
+    ix = np.floor((lon + 180) / cell_deg).astype(np.int64)
+    ncols = int(np.ceil(360 / cell_deg)) + 1
+    return _aggregate(
+        df,
+        iy * ncols + ix,
+        (iy + 0.5) * cell_deg - 90,
+        (ix + 0.5) * cell_deg - 180,
+    )
+
+
+def hex_bin(df, cell_deg):
+    """Aggregate points into pointy-top hexagons ``cell_deg`` degrees wide
+
+    Hex centres form two interleaved rectangular lattices; each point goes to
+    the nearer of its candidate centres on either lattice, which is exactly
+    the hexagon that contains it.
+    """
+    lat = df["latitude"].to_numpy(dtype="float64")
+    lon = df["longitude"].to_numpy(dtype="float64")
+    radius = cell_deg / np.sqrt(3)
+    dx, dy = cell_deg, 3 * radius
+
+    # Lattice A: (i * dx, j * dy); lattice B is shifted by half a cell both ways.
+    ia, ja = np.round(lon / dx), np.round(lat / dy)
+    ib, jb = np.round(lon / dx - 0.5), np.round(lat / dy - 0.5)
+    da = (lon - ia * dx) ** 2 + (lat - ja * dy) ** 2
+    db = (lon - (ib + 0.5) * dx) ** 2 + (lat - (jb + 0.5) * dy) ** 2
+    use_b = db < da
+
+    i = np.where(use_b, ib, ia).astype(np.int64)
+    row = np.where(use_b, 2 * jb + 1, 2 * ja).astype(np.int64)
+    center_lon = (i + np.where(use_b, 0.5, 0.0)) * dx
+    center_lat = row * dy / 2
+    ncols = int(np.ceil(720 / dx)) + 2
+    return _aggregate(df, row * ncols + i, center_lat, center_lon)
+
+
+def hexagon_geojson(cells, cell_deg):
+    """GeoJSON polygons for ``hex_bin`` output, keyed by the ``cell`` column"""
+    radius = cell_deg / np.sqrt(3)
+    angles = np.deg2rad(np.arange(30, 390, 60))
+    lons = cells["longitude"].to_numpy()[:, None] + radius * np.cos(angles)
+    lats = cells["latitude"].to_numpy()[:, None] + radius * np.sin(angles)
+    features = [
+        {
+            "type": "Feature",
+            "id": cell,
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [np.round(np.column_stack([x, y]), 5).tolist()],
+            },
+        }
+        for cell, x, y in zip(cells["cell"], lons, lats)
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def bin_capped(binner, df, cell_deg, max_cells):
+    """``binner(df, cell_deg)`` with cells coarsened until at most ``max_cells`` remain
+
+    Returns ``(cells, cell_deg)``. Cell count falls roughly with the square
+    of the cell width, so each retry widens cells by that ratio plus a margin.
+    """
+    max_cells = max(1, int(max_cells))
+    cells = binner(df, cell_deg)
+    while len(cells) > max_cells:
+        cell_deg *= max(1.25, 1.1 * np.sqrt(len(cells) / max_cells))
+        cells = binner(df, cell_deg)
+    return cells, cell_deg
+
+
+def decimate(df, max_points, seed=0):
+    """Uniformly sample at most ``max_points`` rows to bound the map payload"""
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(df), size=max_points, replace=False))
+    return df.take(rows)
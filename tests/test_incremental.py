@@ -0,0 +1,184 @@
+"""Incremental refresh of the in-memory stores and the Parquet snapshot.
+
+Runs against a throwaway SQLite file standing in for Postgres:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import marine_data  # noqa: E402
+import snapshot  # noqa: E402
+import synthetic  # noqa: E402
+
+
+@pytest.fixture
+def source(tmp_path):
+    """A SQLite ``species_occurrence`` table with 200 rows over 20 days"""
+    engine = marine_data.create_pooled_engine(f"sqlite:///{tmp_path / 'occurrences.db'}")
+    df = synthetic.generate_occurrences(200, days=20)
+    df.to_sql("species_occurrence", engine, index=False)
+    return engine, df
+
+
+def insert(engine, template, dates):
+    """Add one row per date, copied from the first rows of ``template``"""
+    rows = template.iloc[:len(dates)].copy()
+    rows["collection_date"] = list(dates)
+    rows.to_sql("species_occurrence", engine, index=False, if_exists="append")
+
+
+def same_rows(a, b):
+    return snapshot._same_rows(a, b)
+
+
+# -----------------------------
+# IN-MEMORY STORES
+# -----------------------------
+def test_store_picks_up_rows_on_the_watermark_day(source):
+    engine, df = source
+    store = marine_data.occurrence_store(engine, interval=0)
+    cubes = marine_data.rollup_store(engine, interval=0)
+    store.get()
+    cubes.get()
+    day = store.watermark
+    insert(engine, df, [day + pd.Timedelta(hours=5), day + pd.Timedelta(days=1, hours=2)])
+
+    index = store.get()
+    cube = cubes.get()
+    everything = marine_data.read_occurrences(engine)
+    assert same_rows(index.df, everything)
+    assert store.watermark == day + pd.Timedelta(days=1)
+    expected = marine_data.build_rollup(everything)
+    assert cube["count"].sum() == len(everything)
+    assert cube["abundance_sum"].sum() == expected["abundance_sum"].sum()
+    assert len(cube) == len(expected)
+
+
+def test_store_refresh_with_empty_delta_keeps_rows(source):
+    engine, df = source
+    store = marine_data.occurrence_store(engine, "Thunnus albacares", interval=0)
+    before = store.get().df
+    watermark = store.watermark
+    store.refresh()
+    assert same_rows(store.get().df, before)
+    assert store.watermark == watermark
+
+
+def test_replace_since_matches_a_full_rebuild(source):
+    _, df = source
+    index = marine_data.OccurrenceIndex(df)
+    since = pd.Timestamp("2022-01-15")
+    delta = synthetic.generate_occurrences(30, days=10, n_species=5, seed=7)
+    delta["collection_date"] = since + pd.to_timedelta(range(30), unit="h")
+
+    spliced = index.replace_since(delta, since)
+    rebuilt = marine_data.OccurrenceIndex(
+        marine_data.concat_chunks([df[df["collection_date"] < since], delta])
+    )
+    assert same_rows(spliced.df, rebuilt.df)
+    assert spliced.offsets == rebuilt.offsets
+    for species in list(rebuilt.offsets) + [None]:
+        assert len(spliced.filter(species, "2022-01-10", "2022-01-16")) == \
+            len(rebuilt.filter(species, "2022-01-10", "2022-01-16"))
+
+
+def test_failed_first_load_is_not_retried_within_the_interval():
+    calls = []
+
+    def load(since, on_chunk):
+        calls.append(since)
+        raise RuntimeError("database down")
+
+    store = marine_data.IncrementalStore(load, None, interval=60)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            store.get()
+    assert len(calls) == 1
+
+
+# -----------------------------
+# SNAPSHOT
+# -----------------------------
+def test_snapshot_picks_up_rows_on_the_watermark_day(source, tmp_path):
+    engine, df = source
+    path = str(tmp_path / "snapshot")
+    refresher = snapshot.SnapshotRefresher(engine, path)
+    refresher.run_once()
+    day = pd.Timestamp(snapshot.snapshot_info(path)["watermark"])
+    insert(engine, df, [day + pd.Timedelta(hours=3), day + pd.Timedelta(days=1, hours=1)])
+
+    refresher.run_once()
+    info = snapshot.snapshot_info(path)
+    assert same_rows(snapshot.read_snapshot(path), marine_data.read_occurrences(engine))
+    assert info["rows"] == len(df) + 2
+    assert pd.Timestamp(info["watermark"]) == day + pd.Timedelta(days=1)
+
+
+def test_snapshot_refresh_with_empty_delta_keeps_the_version(source, tmp_path):
+    engine, _ = source
+    path = str(tmp_path / "snapshot")
+    refresher = snapshot.SnapshotRefresher(engine, path)
+    refresher.run_once()
+    before = snapshot.snapshot_info(path)
+    refresher.run_once()
+    after = snapshot.snapshot_info(path)
+    assert after["version"] == before["version"]
+    assert after["written_at"] == before["written_at"]
+
+
+def test_compaction_merges_sealed_files_and_deletes_them_later(source, tmp_path, monkeypatch):
+    engine, df = source
+    path = str(tmp_path / "snapshot")
+    refresher = snapshot.SnapshotRefresher(engine, path)
+    refresher.run_once()
+    # One new day per refresh seals the previous one into a new file
+    day = pd.Timestamp(snapshot.snapshot_info(path)["watermark"])
+    for i in range(1, 5):
+        insert(engine, df, [day + pd.Timedelta(days=i)] * 3)
+        refresher.run_once()
+    before = snapshot.snapshot_info(path)
+
+    assert snapshot.compact_snapshot(path, max_files=1) > 0
+    after = snapshot.snapshot_info(path)
+    marker = snapshot._read_marker(path)
+    sealed = [name for name in marker["files"] if name not in marker["open"]]
+    partitions = [os.path.dirname(name) for name in sealed]
+    assert len(partitions) == len(set(partitions))
+    assert after["rows"] == before["rows"]
+    assert after["version"] == before["version"]
+    assert same_rows(snapshot.read_snapshot(path), marine_data.read_occurrences(engine))
+
+    # Retired files stay on disk until RETIRE_AFTER_S has passed
+    retired = [os.path.join(path, name) for name, _ in marker["retired"]]
+    assert retired and all(os.path.exists(name) for name in retired)
+    monkeypatch.setattr(snapshot, "RETIRE_AFTER_S", 0)
+    insert(engine, df, [day + pd.Timedelta(days=5)])
+    refresher.run_once()
+    assert not any(os.path.exists(name) for name in retired)
+    assert same_rows(snapshot.read_snapshot(path), marine_data.read_occurrences(engine))
+
+
+def test_store_seeded_from_snapshot_fetches_only_newer_days(source, tmp_path, monkeypatch):
+    engine, df = source
+    path = str(tmp_path / "snapshot")
+    snapshot.SnapshotRefresher(engine, path).run_once()
+    day = pd.Timestamp(snapshot.snapshot_info(path)["watermark"])
+    insert(engine, df, [day + pd.Timedelta(hours=2), day + pd.Timedelta(days=1)])
+
+    queries = []
+    read = marine_data.read_occurrences
+
+    def spy(engine, query=marine_data.OCCURRENCE_QUERY, params=None, **kwargs):
+        queries.append(params)
+        return read(engine, query, params, **kwargs)
+
+    monkeypatch.setattr(marine_data, "read_occurrences", spy)
+    store = marine_data.occurrence_store(engine, seed=lambda species: snapshot.read_seed(path, species))
+    index = store.get()
+    assert queries == [{"since": day.to_pydatetime()}]
+    assert same_rows(index.df, read(engine))